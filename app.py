@@ -1,6 +1,5 @@
 
 import os
-import networkx as nx
 import re
 import json
 import base64
@@ -8,35 +7,38 @@ import tempfile
 import sys
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import io
+import asyncio
 import os
 import re
 import json
 import base64
 import tempfile
 import subprocess
+import random
+import threading
+import atexit
+import importlib.util
 import logging
 from io import BytesIO
 from typing import Dict, Any, List
+from urllib.parse import urlparse
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.responses import JSONResponse, HTMLResponse
 from fastapi import FastAPI
 from dotenv import load_dotenv
+import orjson
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 
-# Optional image conversion
-try:
-    from PIL import Image
-    PIL_AVAILABLE = True
-except Exception:
-    PIL_AVAILABLE = False
+# Optional image conversion (Pillow is imported lazily where it is used)
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
 
 # LangChain / LLM imports (keep as you used)
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
@@ -48,7 +50,70 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="TDS Data Analyst Agent")
+# Precompiled regex patterns (used on every request)
+_RE_KEY_TYPE = re.compile(r"-\s*`([^`]+)`\s*:\s*(\w+)")
+_RE_HTML_URL = re.compile(r'/wiki/|\.org|\.com', re.IGNORECASE)
+_RE_REF = re.compile(r'\[.*\]')
+_RE_FENCE_OPEN = re.compile(r"^```(?:json)?\s*")
+_RE_FENCE_CLOSE = re.compile(r"\s*```$")
+_RE_SCRAPE_CALL = re.compile(r"scrape_url_to_dataframe\(\s*['\"](.*?)['\"]\s*\)")
+_RE_DATA_NAME = re.compile(r"\bdata\b")
+_RE_SCRAPE_NAMES = re.compile(r"scrape_url_to_dataframe|\brequests\b|\bBeautifulSoup\b")
+_RE_PLOTTING = re.compile(r"\bplt\b|matplotlib|plot_to_base64|seaborn|\bsns\b")
+
+# Connect timeout for outbound fetches: just above a 3s TCP retransmit window, so dead
+# hosts fail fast while read timeouts still cover slow responses
+HTTP_CONNECT_TIMEOUT = 3.05
+
+# Shared HTTP session so outbound fetches reuse pooled keep-alive connections
+_HTTP = requests.Session()
+_HTTP_ADAPTER = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=10,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "HEAD"]),  # idempotent only
+        respect_retry_after_header=False,  # a large Retry-After would stall the worker; use our backoff
+        raise_on_status=False  # hand the last response back so raise_for_status reports it
+    )
+)
+_HTTP.mount("https://", _HTTP_ADAPTER)
+_HTTP.mount("http://", _HTTP_ADAPTER)
+atexit.register(_HTTP.close)
+# Accept-Encoding is left to requests' default, which advertises gzip/deflate
+# and br once brotli is installed, so large HTML pages arrive compressed
+_HTTP.headers.update({
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/138.0.0.0 Safari/537.36"
+    ),
+    "Referer": "https://www.google.com/",
+})
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (FastAPI's own ORJSONResponse is deprecated)."""
+
+    def render(self, content: Any) -> bytes:
+        # NaN/Infinity become null, numpy values and non-str keys are handled natively
+        try:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g. integers wider than 64 bits, which orjson refuses
+            return json.dumps(content, default=str).encode("utf-8")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # defined with the diagnostics further down; only looked up at shutdown
+    await _close_diag_client()
+
+
+app = FastAPI(title="TDS Data Analyst Agent", default_response_class=FastJSONResponse, lifespan=lifespan)
 
 # Serve ui.html at /test
 from fastapi.responses import HTMLResponse
@@ -261,8 +326,11 @@ class LLMWithFallback:
                     
                     if error_category in ["quota", "unavailable"]:
                         delay *= 2  # Longer delay for these errors
+
+                    # Jitter so concurrent requests backing off on the same key don't retry in lockstep
+                    delay = random.uniform(delay / 2, delay)
                     
-                    logger.info(f"Waiting {delay}s before next attempt...")
+                    logger.info(f"Waiting {delay:.1f}s before next attempt...")
                     time.sleep(delay)
 
         # Log final statistics before failing
@@ -385,9 +453,7 @@ def parse_keys_and_types(raw_questions: str):
         keys_list: list of keys in order
         type_map: dict key -> casting function
     """
-    import re
-    pattern = r"-\s*`([^`]+)`\s*:\s*(\w+)"
-    matches = re.findall(pattern, raw_questions)
+    matches = _RE_KEY_TYPE.findall(raw_questions)
     type_map_def = {
         "number": float,
         "string": str,
@@ -405,76 +471,170 @@ def parse_keys_and_types(raw_questions: str):
 # -----------------------------
 # Tools
 # -----------------------------
+SCRAPE_CACHE_TTL_SECONDS = int(os.getenv("SCRAPE_CACHE_TTL_SECONDS", 3600))
+_SCRAPE_CACHE: Dict[str, tuple] = {}  # url -> (fetched_at, DataFrame)
+_SCRAPE_CACHE_LOCK = threading.Lock()  # guards pruning/inserts; reads stay lock-free
+# Striped locks (url -> lock by hash) so concurrent fetches of one URL coalesce
+# without keeping a lock per URL ever seen
+_SCRAPE_LOCKS: List[threading.Lock] = [threading.Lock() for _ in range(64)]
+SCRAPE_BREAKER_FAIL_MAX = 3
+SCRAPE_BREAKER_RESET_SECONDS = 30
 
-@tool
-def scrape_url_to_dataframe(url: str) -> Dict[str, Any]:
+
+class CircuitBreaker:
     """
-    Fetch a URL and return data as a DataFrame (supports HTML tables, CSV, Excel, Parquet, JSON, and plain text).
-    Always returns {"status": "success", "data": [...], "columns": [...]} if fetch works.
+    Fail fast on a host after repeated failures instead of waiting out the full timeout each time.
+    CLOSED until fail_max consecutive failures, then OPEN for reset_timeout seconds,
+    then HALF_OPEN: one trial call is let through and its outcome closes or re-opens the breaker.
     """
-    print(f"Scraping URL: {url}")
-    try:
-        from io import BytesIO, StringIO
-        from bs4 import BeautifulSoup
-
-        headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/138.0.0.0 Safari/537.36"
-            ),
-            "Referer": "https://www.google.com/",
-        }
 
-        resp = requests.get(url, headers=headers, timeout=20)
-        resp.raise_for_status()
-        ctype = resp.headers.get("Content-Type", "").lower()
+    def __init__(self, fail_max=SCRAPE_BREAKER_FAIL_MAX, reset_timeout=SCRAPE_BREAKER_RESET_SECONDS):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
 
-        df = None
+    def allow(self) -> bool:
+        with self._lock:
+            if self.failures < self.fail_max:
+                return True
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # half-open: restart the cool-down so only this caller gets the trial
+                self.opened_at = time.time()
+                return True
+            return False
 
-        # --- CSV ---
-        if "text/csv" in ctype or url.lower().endswith(".csv"):
-            df = pd.read_csv(BytesIO(resp.content))
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
 
-        # --- Excel ---
-        elif any(url.lower().endswith(ext) for ext in (".xls", ".xlsx")) or "spreadsheetml" in ctype:
-            df = pd.read_excel(BytesIO(resp.content))
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.fail_max:
+                self.opened_at = time.time()
 
-        # --- Parquet ---
-        elif url.lower().endswith(".parquet"):
-            df = pd.read_parquet(BytesIO(resp.content))
 
-        # --- JSON ---
-        elif "application/json" in ctype or url.lower().endswith(".json"):
-            try:
-                data = resp.json()
-                df = pd.json_normalize(data)
-            except Exception:
-                df = pd.DataFrame([{"text": resp.text}])
+_SCRAPE_BREAKERS: Dict[str, CircuitBreaker] = {}  # host -> breaker
 
-        # --- HTML / Fallback ---
-        elif "text/html" in ctype or re.search(r'/wiki/|\.org|\.com', url, re.IGNORECASE):
-            html_content = resp.text
-            # Try HTML tables first
-            try:
-                tables = pd.read_html(StringIO(html_content), flavor="bs4")
-                if tables:
-                    df = tables[0]
-            except ValueError:
-                pass
-
-            # If no table found, fallback to plain text
-            if df is None:
-                soup = BeautifulSoup(html_content, "html.parser")
-                text = soup.get_text(separator="\n", strip=True)
-                df = pd.DataFrame({"text": [text]})
-
-        # --- Unknown type fallback ---
-        else:
-            df = pd.DataFrame({"text": [resp.text]})
 
-        # --- Normalize columns ---
-        df.columns = df.columns.map(str).str.replace(r'\[.*\]', '', regex=True).str.strip()
+def _fetch_url_dataframe(url: str) -> pd.DataFrame:
+    """
+    Fetch a URL and parse it into a DataFrame (HTML tables, CSV, Excel, Parquet, JSON, or plain text).
+    Raises on network/HTTP errors.
+    """
+    from io import BytesIO, StringIO
+    from bs4 import BeautifulSoup
+
+    resp = _HTTP.get(url, timeout=(HTTP_CONNECT_TIMEOUT, 20))
+    resp.raise_for_status()
+    ctype = resp.headers.get("Content-Type", "").lower()
+    url_lower = url.lower()
+
+    df = None
+
+    # --- CSV ---
+    if "text/csv" in ctype or url_lower.endswith(".csv"):
+        df = pd.read_csv(BytesIO(resp.content))
+
+    # --- Excel ---
+    elif url_lower.endswith((".xls", ".xlsx")) or "spreadsheetml" in ctype:
+        df = pd.read_excel(BytesIO(resp.content))
+
+    # --- Parquet ---
+    elif url_lower.endswith(".parquet"):
+        df = pd.read_parquet(BytesIO(resp.content))
+
+    # --- JSON ---
+    elif "application/json" in ctype or url_lower.endswith(".json"):
+        try:
+            data = resp.json()
+            df = pd.json_normalize(data)
+        except Exception:
+            df = pd.DataFrame([{"text": resp.text}])
+
+    # --- HTML / Fallback ---
+    elif "text/html" in ctype or _RE_HTML_URL.search(url):
+        html_content = resp.text
+        # Try HTML tables first (lxml's C parser; pandas retries with bs4 if it fails)
+        try:
+            tables = pd.read_html(StringIO(html_content), flavor=["lxml", "bs4"])
+            if tables:
+                df = tables[0]
+        except ValueError:
+            pass
+
+        # If no table found, fallback to plain text
+        if df is None:
+            soup = BeautifulSoup(html_content, "html.parser")
+            text = soup.get_text(separator="\n", strip=True)
+            df = pd.DataFrame({"text": [text]})
+
+    # --- Unknown type fallback ---
+    else:
+        df = pd.DataFrame({"text": [resp.text]})
+
+    # --- Normalize columns ---
+    df.columns = df.columns.map(str).str.replace(_RE_REF, '', regex=True).str.strip()
+
+    return df
+
+
+def _get_url_dataframe(url: str) -> pd.DataFrame:
+    """
+    Return the DataFrame for a URL, serving repeat requests from an in-memory TTL cache.
+    A striped per-URL lock keeps concurrent requests from scraping the same page twice, and a
+    per-host circuit breaker fails fast (or serves a stale copy) while the host is down.
+    """
+    entry = _SCRAPE_CACHE.get(url)
+    if entry and time.time() - entry[0] < SCRAPE_CACHE_TTL_SECONDS:
+        return entry[1].copy()
+
+    with _SCRAPE_LOCKS[hash(url) % len(_SCRAPE_LOCKS)]:
+        entry = _SCRAPE_CACHE.get(url)
+        if entry and time.time() - entry[0] < SCRAPE_CACHE_TTL_SECONDS:
+            return entry[1].copy()
+
+        host = urlparse(url).netloc
+        breaker = _SCRAPE_BREAKERS.setdefault(host, CircuitBreaker())
+        if not breaker.allow():
+            if entry:
+                logger.warning(f"Circuit open for {host}, serving stale cached copy of {url}")
+                return entry[1].copy()
+            raise RuntimeError(f"Circuit open for {host}: recent fetches failed, retry in a few seconds")
+
+        try:
+            df = _fetch_url_dataframe(url)
+        except (requests.ConnectionError, requests.Timeout):
+            breaker.record_failure()
+            raise
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code >= 500:
+                breaker.record_failure()
+            raise
+        breaker.record_success()
+
+        now = time.time()
+        # different stripes can write concurrently, so prune and insert under one lock
+        with _SCRAPE_CACHE_LOCK:
+            # drop expired entries so the cache does not grow without bound
+            for cached_url in [u for u, (ts, _) in _SCRAPE_CACHE.items() if now - ts >= SCRAPE_CACHE_TTL_SECONDS]:
+                _SCRAPE_CACHE.pop(cached_url, None)
+            _SCRAPE_CACHE[url] = (now, df)
+
+    return df.copy()
+
+
+@tool
+def scrape_url_to_dataframe(url: str) -> Dict[str, Any]:
+    """
+    Fetch a URL and return data as a DataFrame (supports HTML tables, CSV, Excel, Parquet, JSON, and plain text).
+    Always returns {"status": "success", "data": [...], "columns": [...]} if fetch works.
+    """
+    print(f"Scraping URL: {url}")
+    try:
+        df = _get_url_dataframe(url)
 
         return {
             "status": "success",
@@ -498,8 +658,8 @@ def clean_llm_output(output: str) -> Dict:
         if not output:
             return {"error": "Empty LLM output"}
         # remove triple-fence markers if present
-        s = re.sub(r"^```(?:json)?\s*", "", output.strip())
-        s = re.sub(r"\s*```$", "", s)
+        s = _RE_FENCE_OPEN.sub("", output.strip())
+        s = _RE_FENCE_CLOSE.sub("", s)
         # find outermost JSON object by scanning for balanced braces
         first = s.find("{")
         last = s.rfind("}")
@@ -507,13 +667,16 @@ def clean_llm_output(output: str) -> Dict:
             return {"error": "No JSON object found in LLM output", "raw": s}
         candidate = s[first:last+1]
         try:
-            return json.loads(candidate)
+            return orjson.loads(candidate)
         except Exception as e:
-            # fallback: try last balanced pair scanning backwards
-            for i in range(last, first, -1):
+            # fallback: try last balanced pair scanning backwards (one parse per
+            # closing brace, so use the fast parser and skip impossible cut points)
+            for i in range(last - 1, first, -1):
+                if s[i] != "}":
+                    continue
                 cand = s[first:i+1]
                 try:
-                    return json.loads(cand)
+                    return orjson.loads(cand)
                 except Exception:
                     continue
             return {"error": f"JSON parsing failed: {str(e)}", "raw": candidate}
@@ -523,17 +686,26 @@ def clean_llm_output(output: str) -> Dict:
 SCRAPE_FUNC = r'''
 from typing import Dict, Any
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 import pandas as pd
 import re
 
+# one pooled session so repeated scrapes in the same script reuse connections
+_SESSION = requests.Session()
+_SESSION.headers.update({"User-Agent": "Mozilla/5.0"})
+_SESSION_ADAPTER = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+)
+_SESSION.mount("https://", _SESSION_ADAPTER)
+_SESSION.mount("http://", _SESSION_ADAPTER)
+
 def scrape_url_to_dataframe(url: str) -> Dict[str, Any]:
     try:
-        response = requests.get(
-            url,
-            headers={"User-Agent": "Mozilla/5.0"},
-            timeout=5
-        )
+        response = _SESSION.get(url, timeout=(3.05, 5))
         response.raise_for_status()
     except Exception as e:
         return {
@@ -579,9 +751,134 @@ def scrape_url_to_dataframe(url: str) -> Dict[str, Any]:
 '''
 
 
+def pickle_dataframe(df: pd.DataFrame) -> str:
+    """Pickle a DataFrame to a temp file for injection into the sandbox script; returns the path."""
+    temp_pkl = tempfile.NamedTemporaryFile(suffix=".pkl", delete=False)
+    temp_pkl.close()
+    df.to_pickle(temp_pkl.name)
+    return temp_pkl.name
+
+
+def prefetch_scrape_for_code(code: str):
+    """
+    If the generated code calls scrape_url_to_dataframe("URL"), scrape it here and pickle the result.
+    Returns (pickle_path, error); both are None when the code does not scrape.
+    """
+    urls = _RE_SCRAPE_CALL.findall(code)
+    if not urls:
+        return None, None
+    # For now support only the first URL (agent may code multiple scrapes; you can extend this)
+    try:
+        df = _get_url_dataframe(urls[0])
+    except Exception as e:
+        return None, f"Scrape tool failed: {e}"
+    return pickle_dataframe(df), None
+
+
+# Helpers injected into every sandbox script; built once at import.
+# plot_to_base64 tries to keep images under 100_000 bytes.
+SANDBOX_HELPERS = r'''
+def _thin_scatter(fig, max_points=2000):
+    # overlapping markers beyond a few thousand add render time and bytes, not information
+    from matplotlib.collections import PathCollection
+    rng = np.random.default_rng(0)
+    for ax in fig.axes:
+        for coll in ax.collections:
+            if not isinstance(coll, PathCollection):
+                continue
+            offsets = coll.get_offsets()
+            n = len(offsets)
+            if n <= max_points:
+                continue
+            idx = np.sort(rng.choice(n, max_points, replace=False))
+            coll.set_offsets(offsets[idx])
+            sizes = coll.get_sizes()
+            if len(sizes) == n:
+                coll.set_sizes(sizes[idx])
+            arr = coll.get_array()
+            if arr is not None:
+                if len(arr) == n:
+                    coll.set_array(arr[idx])
+                continue
+            facecolors = coll.get_facecolors()
+            if len(facecolors) == n:
+                coll.set_facecolors(facecolors[idx])
+            edgecolors = coll.get_edgecolors()
+            if len(edgecolors) == n:
+                coll.set_edgecolors(edgecolors[idx])
+
+
+def plot_to_base64(max_bytes=100000):
+    fig = plt.gcf()
+    _thin_scatter(fig)
+    buf = BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight', dpi=100)
+    # release the figure so the next plot starts clean instead of drawing over this one
+    plt.close(fig)
+    # getbuffer() is a zero-copy view; getvalue() would duplicate the image bytes
+    img_bytes = buf.getbuffer()
+    if len(img_bytes) <= max_bytes:
+        return _b64encode(img_bytes).decode('ascii')
+    # too large: shrink the already rendered image instead of re-rendering the
+    # figure. Stay PNG first (callers label it data:image/png), using a 256-colour
+    # palette and downscaling; WEBP is only the last resort.
+    # Pillow is always present since matplotlib depends on it.
+    from PIL import Image
+    buf.seek(0)
+    im = Image.open(buf)
+    im.load()
+    im = im.convert('RGB')
+    for scale in (1.0, 0.75, 0.5, 0.35):
+        if scale < 1.0:
+            size = (max(1, int(im.width * scale)), max(1, int(im.height * scale)))
+            frame = im.resize(size, Image.LANCZOS)
+        else:
+            frame = im
+        out_buf = BytesIO()
+        frame.quantize(colors=256).save(out_buf, format='PNG', optimize=True)
+        ob = out_buf.getbuffer()
+        if len(ob) <= max_bytes:
+            return _b64encode(ob).decode('ascii')
+    for scale, quality in [(0.5, 60), (0.3, 50)]:
+        size = (max(1, int(im.width * scale)), max(1, int(im.height * scale)))
+        out_buf = BytesIO()
+        im.resize(size, Image.LANCZOS).save(out_buf, format='WEBP', quality=quality, method=6)
+        ob = out_buf.getbuffer()
+        if len(ob) <= max_bytes:
+            break
+    # as last resort return the smallest WEBP even if > max_bytes
+    return _b64encode(ob).decode('ascii')
+
+
+def slope_intercept(x, y):
+    # closed-form least squares; cheaper than scipy.stats.linregress when only the line is needed
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    xm = x.mean()
+    ym = y.mean()
+    dx = x - xm
+    slope = (dx * (y - ym)).sum() / (dx * dx).sum()
+    return float(slope), float(ym - slope * xm)
+'''
+
+
+# Runs the script read from stdin as __main__ under the name "<sandbox>"; registering
+# it with linecache (and printing uncaught errors via the traceback module, which
+# reads linecache) keeps source lines in tracebacks, and sys.path[0] points at the
+# temp dir as it did when scripts were run from a temp file
+_SANDBOX_BOOTSTRAP = (
+    "import sys as _sys, linecache as _lc, tempfile as _tf, traceback as _tb\n"
+    "_src = _sys.stdin.buffer.read().decode('utf-8')\n"
+    "_lc.cache['<sandbox>'] = (len(_src), None, _src.splitlines(True), '<sandbox>')\n"
+    "_sys.excepthook = _tb.print_exception\n"
+    "_sys.path[0] = _tf.gettempdir()\n"
+    "exec(compile(_src, '<sandbox>', 'exec'))\n"
+)
+
+
 def write_and_run_temp_python(code: str, injected_pickle: str = None, timeout: int = 60) -> Dict[str, Any]:
     """
-    Write a temp python file which:
+    Build a python script which:
       - provides a safe environment (imports)
       - loads df/from pickle if provided into df and data variables
       - defines a robust plot_to_base64() helper that ensures < 100kB (attempts resizing/conversion)
@@ -591,96 +888,64 @@ def write_and_run_temp_python(code: str, injected_pickle: str = None, timeout: i
     """
     # create file content
     preamble = [
-        "import json, sys, gc",
+        "import json, sys, gc, re",
+        "from typing import Dict, Any",
         "import pandas as pd, numpy as np",
-        "import matplotlib",
-        "matplotlib.use('Agg')",
-        "import matplotlib.pyplot as plt",
+    ]
+    # matplotlib is the slowest sandbox import; only load it when the code plots
+    if _RE_PLOTTING.search(code):
+        preamble += [
+            "import matplotlib",
+            "matplotlib.use('Agg')",
+            "import matplotlib.pyplot as plt",
+        ]
+    preamble += [
         "from io import BytesIO",
         "import base64",
+        # SIMD base64 codec for plot encoding when available
+        "try:\n    from pybase64 import b64encode as _b64encode\nexcept ImportError:\n    from base64 import b64encode as _b64encode",
     ]
     if PIL_AVAILABLE:
         preamble.append("from PIL import Image")
     # inject df if a pickle path provided
     if injected_pickle:
         preamble.append(f"df = pd.read_pickle(r'''{injected_pickle}''')\n")
-        preamble.append("data = df.to_dict(orient='records')\n")
+        # records form costs a full row-by-row pass over df; only build it when the code uses `data`
+        if _RE_DATA_NAME.search(code):
+            preamble.append("data = df.to_dict(orient='records')\n")
     else:
         # ensure data exists so user code that references data won't break
         preamble.append("data = globals().get('data', {})\n")
 
-    # plot_to_base64 helper that tries to reduce size under 100_000 bytes
-    helper = r'''
-def plot_to_base64(max_bytes=100000):
-    buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-    buf.seek(0)
-    img_bytes = buf.getvalue()
-    if len(img_bytes) <= max_bytes:
-        return base64.b64encode(img_bytes).decode('ascii')
-    # try decreasing dpi/figure size iteratively
-    for dpi in [80, 60, 50, 40, 30]:
-        buf = BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=dpi)
-        buf.seek(0)
-        b = buf.getvalue()
-        if len(b) <= max_bytes:
-            return base64.b64encode(b).decode('ascii')
-    # if Pillow available, try convert to WEBP which is typically smaller
-    try:
-        from PIL import Image
-        buf = BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=40)
-        buf.seek(0)
-        im = Image.open(buf)
-        out_buf = BytesIO()
-        im.save(out_buf, format='WEBP', quality=80, method=6)
-        out_buf.seek(0)
-        ob = out_buf.getvalue()
-        if len(ob) <= max_bytes:
-            return base64.b64encode(ob).decode('ascii')
-        # try lower quality
-        out_buf = BytesIO()
-        im.save(out_buf, format='WEBP', quality=60, method=6)
-        out_buf.seek(0)
-        ob = out_buf.getvalue()
-        if len(ob) <= max_bytes:
-            return base64.b64encode(ob).decode('ascii')
-    except Exception:
-        pass
-    # as last resort return downsized PNG even if > max_bytes
-    buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', dpi=20)
-    buf.seek(0)
-    return base64.b64encode(buf.getvalue()).decode('ascii')
-'''
-
     # Build the code to write
     script_lines = []
     script_lines.extend(preamble)
-    script_lines.append(helper)
-    script_lines.append(SCRAPE_FUNC)
+    script_lines.append(SANDBOX_HELPERS)
+    # the scrape helper pulls in requests + bs4; only ship it (and with it the
+    # requests/BeautifulSoup globals) to code that names them
+    if _RE_SCRAPE_NAMES.search(code):
+        script_lines.append(SCRAPE_FUNC)
     script_lines.append("\nresults = {}\n")
     script_lines.append(code)
     # ensure results printed as json
     script_lines.append("\nprint(json.dumps({'status':'success','result':results}, default=str), flush=True)\n")
 
-    tmp = tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8')
-    tmp.write("\n".join(script_lines))
-    tmp.flush()
-    tmp_path = tmp.name
-    tmp.close()
+    script = "\n".join(script_lines)
 
     try:
-        completed = subprocess.run([sys.executable, tmp_path],
-                                   capture_output=True, text=True, timeout=timeout)
+        # feed the script on stdin rather than writing and re-reading a temp file
+        completed = subprocess.run([sys.executable, "-c", _SANDBOX_BOOTSTRAP], input=script,
+                                   capture_output=True, text=True, encoding="utf-8",
+                                   timeout=timeout)
         if completed.returncode != 0:
             # collect stderr and stdout for debugging
             return {"status": "error", "message": completed.stderr.strip() or completed.stdout.strip()}
-        # parse stdout as json
+        # results are printed last on a single line; parse just that line so
+        # earlier prints from the generated code neither break nor slow the parse.
+        # json (not orjson) here: the sandbox's json.dumps may emit NaN/Infinity and big ints
         out = completed.stdout.strip()
         try:
-            parsed = json.loads(out)
+            parsed = json.loads(out.rpartition("\n")[2])
             return parsed
         except Exception as e:
             return {"status": "error", "message": f"Could not parse JSON output: {str(e)}", "raw": out}
@@ -688,7 +953,6 @@ def plot_to_base64(max_bytes=100000):
         return {"status": "error", "message": "Execution timed out"}
     finally:
         try:
-            os.unlink(tmp_path)
             if injected_pickle and os.path.exists(injected_pickle):
                 os.unlink(injected_pickle)
         except Exception:
@@ -730,6 +994,7 @@ You must:
 4. Your Python code will run in a sandbox with:
    - pandas, numpy, matplotlib available
    - A helper function `plot_to_base64(max_bytes=100000)` for generating base64-encoded images under 100KB.
+   - A helper function `slope_intercept(x, y)` returning `(slope, intercept)` of the least-squares line; use it instead of scipy.stats.linregress when only the slope or regression line is needed.
 5. When returning plots, always use `plot_to_base64()` to keep image sizes small.
 6. Make sure all variables are defined before use, and the code can run without any undefined references.
 """),
@@ -743,10 +1008,14 @@ agent = create_tool_calling_agent(
     prompt=prompt
 )
 
+# Full chain tracing prints every prompt and the whole generated code per request;
+# keep it opt-in and log a one-line summary per run instead
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE", "").lower() in ("1", "true", "yes")
+
 agent_executor = AgentExecutor(
     agent=agent,
     tools=[scrape_url_to_dataframe],
-    verbose=True,
+    verbose=AGENT_VERBOSE,
     max_iterations=3,
     early_stopping_method="generate",
     handle_parsing_errors=True,
@@ -810,22 +1079,10 @@ def run_agent_safely(llm_input: str) -> Dict:
             code = parsed["code"]
             questions: List[str] = parsed["questions"]
 
-            # Detect scrape calls; find all URLs used in scrape_url_to_dataframe("URL")
-            urls = re.findall(r"scrape_url_to_dataframe\(\s*['\"](.*?)['\"]\s*\)", code)
-            pickle_path = None
-            if urls:
-                # For now support only the first URL (agent may code multiple scrapes; you can extend this)
-                url = urls[0]
-                tool_resp = scrape_url_to_dataframe(url)
-                if tool_resp.get("status") != "success":
-                    return {"error": f"Scrape tool failed: {tool_resp.get('message')}"}
-                # create df and pickle it
-                df = pd.DataFrame(tool_resp["data"])
-                temp_pkl = tempfile.NamedTemporaryFile(suffix=".pkl", delete=False)
-                temp_pkl.close()
-                df.to_pickle(temp_pkl.name)
-                pickle_path = temp_pkl.name
-                # Make sure agent's code can reference df/data: we will inject the pickle loader in the temp script
+            # Detect scrape calls and pre-scrape so the agent's code can reference df/data
+            pickle_path, scrape_error = prefetch_scrape_for_code(code)
+            if scrape_error:
+                return {"error": scrape_error}
 
             # Execute code in temp python script
             exec_result = write_and_run_temp_python(code, injected_pickle=pickle_path, timeout=LLM_TIMEOUT_SECONDS)
@@ -861,6 +1118,99 @@ def run_agent_safely(llm_input: str) -> Dict:
 
 from fastapi import Request
 
+MAX_QUESTIONS_BYTES = 1 << 20  # 1 MiB
+MAX_DATA_FILE_BYTES = int(os.getenv("MAX_DATA_FILE_MB", 200)) << 20
+UPLOAD_CHUNK_BYTES = 1 << 16
+
+# Prompt rules sent with every /api request, chosen by whether a dataset was uploaded
+LLM_RULES_WITH_DATASET = (
+    "Rules:\n"
+    "1) You have access to a pandas DataFrame called `df` and its dictionary form `data`.\n"
+    "2) DO NOT call scrape_url_to_dataframe() or fetch any external data.\n"
+    "3) Use only the uploaded dataset for answering questions.\n"
+    "4) Produce a final JSON object with keys:\n"
+    '   - "questions": [ ... original question strings ... ]\n'
+    '   - "code": "..."  (Python code that fills `results` with exact question strings as keys)\n'
+    "5) For plots: use plot_to_base64() helper to return base64 image data under 100kB.\n"
+)
+
+LLM_RULES_WITHOUT_DATASET = (
+    "Rules:\n"
+    "1) If you need web data, CALL scrape_url_to_dataframe(url).\n"
+    "2) Produce a final JSON object with keys:\n"
+    '   - "questions": [ ... original question strings ... ]\n'
+    '   - "code": "..."  (Python code that fills `results` with exact question strings as keys)\n'
+    "3) For plots: use plot_to_base64() helper to return base64 image data under 100kB.\n"
+    "4) When querying remote Parquet/S3 data with DuckDB, aggregate inside SQL "
+    "(GROUP BY, AVG, regr_slope(y, x) for regression slopes) and fetch only the small result, not raw rows.\n"
+    "5) For partitioned Parquet paths (e.g. .../year=*/court=*/...), use read_parquet(..., hive_partitioning=1) "
+    "and filter on the partition columns in WHERE so DuckDB skips non-matching files.\n"
+)
+
+# Bulkhead: cap concurrent agent runs so a burst of requests can't exhaust
+# worker threads, sandbox subprocesses and LLM quota all at once
+MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", 4))
+# How long a request may queue for a free slot before being turned away with 503
+ANALYSIS_QUEUE_TIMEOUT_SECONDS = int(os.getenv("ANALYSIS_QUEUE_TIMEOUT_SECONDS", 30))
+_ANALYSIS_SLOTS = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+
+
+async def read_upload_capped(upload, max_bytes: int) -> bytearray:
+    """Read an uploaded file in chunks, failing with 413 as soon as it exceeds max_bytes."""
+    buf = bytearray()
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        buf += chunk
+        if len(buf) > max_bytes:
+            raise HTTPException(413, f"Uploaded file too large: {upload.filename} (limit {max_bytes} bytes)")
+    return buf
+
+
+def load_uploaded_dataset(filename: str, content: bytes):
+    """
+    Parse an uploaded data file, pickle it for injection into the sandbox and build the LLM preview.
+    Blocking (pandas/Pillow); call it from a worker thread.
+    Returns (pickle_path, df_preview).
+    """
+    if filename.endswith(".csv"):
+        df = pd.read_csv(BytesIO(content))
+    elif filename.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(BytesIO(content))
+    elif filename.endswith(".parquet"):
+        df = pd.read_parquet(BytesIO(content))
+    elif filename.endswith(".json"):
+        try:
+            df = pd.read_json(BytesIO(content))
+        except ValueError:
+            df = pd.DataFrame(json.loads(content.decode("utf-8")))
+    elif filename.endswith(".png") or filename.endswith(".jpg") or filename.endswith(".jpeg"):
+        try:
+            if PIL_AVAILABLE:
+                from PIL import Image
+                image = Image.open(BytesIO(content))
+                image = image.convert("RGB")  # ensure RGB format
+                df = pd.DataFrame({"image": [image]})
+            else:
+                raise HTTPException(400, "PIL not available for image processing")
+        except Exception as e:
+            raise HTTPException(400, f"Image processing failed: {str(e)}")  
+    else:
+        raise HTTPException(400, f"Unsupported data file type: {filename}")
+
+    # Pickle for injection
+    pickle_path = pickle_dataframe(df)
+
+    df_preview = (
+        f"\n\nThe uploaded dataset has {len(df)} rows and {len(df.columns)} columns.\n"
+        f"Columns: {', '.join(df.columns.astype(str))}\n"
+        f"First rows:\n{df.head(5).to_markdown(index=False)}\n"
+    )
+
+    return pickle_path, df_preview
+
+
 @app.post("/api")
 async def analyze_data(request: Request):
     try:
@@ -879,76 +1229,33 @@ async def analyze_data(request: Request):
         if not questions_file:
             raise HTTPException(400, "Missing questions file (.txt)")
 
-        raw_questions = (await questions_file.read()).decode("utf-8")
+        raw_questions = (await read_upload_capped(questions_file, MAX_QUESTIONS_BYTES)).decode("utf-8")
         keys_list, type_map = parse_keys_and_types(raw_questions)
 
         pickle_path = None
         df_preview = ""
         dataset_uploaded = False
 
+        # Wait for a slot before reading/parsing the dataset, so refused requests skip
+        # the pandas work and never leave a temp pickle behind
+        try:
+            await asyncio.wait_for(_ANALYSIS_SLOTS.acquire(), timeout=ANALYSIS_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(503, "Server busy, try again later")
+
         if data_file:
             dataset_uploaded = True
             filename = data_file.filename.lower()
-            content = await data_file.read()
-            from io import BytesIO
-
-            if filename.endswith(".csv"):
-                df = pd.read_csv(BytesIO(content))
-            elif filename.endswith((".xlsx", ".xls")):
-                df = pd.read_excel(BytesIO(content))
-            elif filename.endswith(".parquet"):
-                df = pd.read_parquet(BytesIO(content))
-            elif filename.endswith(".json"):
-                try:
-                    df = pd.read_json(BytesIO(content))
-                except ValueError:
-                    df = pd.DataFrame(json.loads(content.decode("utf-8")))
-            elif filename.endswith(".png") or filename.endswith(".jpg") or filename.endswith(".jpeg"):
-                try:
-                    if PIL_AVAILABLE:
-                        image = Image.open(BytesIO(content))
-                        image = image.convert("RGB")  # ensure RGB format
-                        df = pd.DataFrame({"image": [image]})
-                    else:
-                        raise HTTPException(400, "PIL not available for image processing")
-                except Exception as e:
-                    raise HTTPException(400, f"Image processing failed: {str(e)}")  
-            else:
-                raise HTTPException(400, f"Unsupported data file type: {filename}")
-
-            # Pickle for injection
-            temp_pkl = tempfile.NamedTemporaryFile(suffix=".pkl", delete=False)
-            temp_pkl.close()
-            df.to_pickle(temp_pkl.name)
-            pickle_path = temp_pkl.name
-
-            df_preview = (
-                f"\n\nThe uploaded dataset has {len(df)} rows and {len(df.columns)} columns.\n"
-                f"Columns: {', '.join(df.columns.astype(str))}\n"
-                f"First rows:\n{df.head(5).to_markdown(index=False)}\n"
-            )
+            try:
+                content = await read_upload_capped(data_file, MAX_DATA_FILE_BYTES)
+                # parsing, pickling and rendering the preview are blocking pandas work
+                pickle_path, df_preview = await asyncio.to_thread(load_uploaded_dataset, filename, content)
+            except BaseException:
+                _ANALYSIS_SLOTS.release()
+                raise
 
         # Build rules based on data presence
-        if dataset_uploaded:
-            llm_rules = (
-                "Rules:\n"
-                "1) You have access to a pandas DataFrame called `df` and its dictionary form `data`.\n"
-                "2) DO NOT call scrape_url_to_dataframe() or fetch any external data.\n"
-                "3) Use only the uploaded dataset for answering questions.\n"
-                "4) Produce a final JSON object with keys:\n"
-                '   - "questions": [ ... original question strings ... ]\n'
-                '   - "code": "..."  (Python code that fills `results` with exact question strings as keys)\n'
-                "5) For plots: use plot_to_base64() helper to return base64 image data under 100kB.\n"
-            )
-        else:
-            llm_rules = (
-                "Rules:\n"
-                "1) If you need web data, CALL scrape_url_to_dataframe(url).\n"
-                "2) Produce a final JSON object with keys:\n"
-                '   - "questions": [ ... original question strings ... ]\n'
-                '   - "code": "..."  (Python code that fills `results` with exact question strings as keys)\n'
-                "3) For plots: use plot_to_base64() helper to return base64 image data under 100kB.\n"
-            )
+        llm_rules = LLM_RULES_WITH_DATASET if dataset_uploaded else LLM_RULES_WITHOUT_DATASET
 
         llm_input = (
             f"{llm_rules}\nQuestions:\n{raw_questions}\n"
@@ -956,14 +1263,15 @@ async def analyze_data(request: Request):
             "Respond with the JSON object only."
         )
 
-        # Run agent
-        import concurrent.futures
-        with concurrent.futures.ThreadPoolExecutor() as ex:
-            fut = ex.submit(run_agent_safely_unified, llm_input, pickle_path)
-            try:
-                result = fut.result(timeout=LLM_TIMEOUT_SECONDS)
-            except concurrent.futures.TimeoutError:
-                raise HTTPException(408, "Processing timeout")
+        # Run agent in a worker thread so the event loop keeps serving other requests
+        # the slot is released when the worker thread finishes, not when we stop waiting:
+        # a timed-out thread keeps running and must keep counting against the cap
+        work = asyncio.ensure_future(asyncio.to_thread(run_agent_safely_unified, llm_input, pickle_path))
+        work.add_done_callback(lambda _: _ANALYSIS_SLOTS.release())
+        try:
+            result = await asyncio.wait_for(asyncio.shield(work), timeout=LLM_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(408, "Processing timeout")
 
         if "error" in result:
             raise HTTPException(500, detail=result["error"])
@@ -971,21 +1279,22 @@ async def analyze_data(request: Request):
         # Post-process key mapping & type casting
         if keys_list and type_map:
             mapped = {}
-            for idx, q in enumerate(result.keys()):
-                if idx < len(keys_list):
-                    key = keys_list[idx]
-                    caster = type_map.get(key, str)
-                    try:
-                        val = result[q]
-                        if isinstance(val, str) and val.startswith("data:image/"):
-                            # Remove data URI prefix
-                            val = val.split(",", 1)[1] if "," in val else val
-                        mapped[key] = caster(val) if val not in (None, "") else val
-                    except Exception:
-                        mapped[key] = result[q]
+            # zip pairs answers with keys positionally and stops at the shorter list
+            for key, raw_val in zip(keys_list, result.values()):
+                caster = type_map.get(key, str)
+                try:
+                    val = raw_val
+                    if isinstance(val, str) and val.startswith("data:image/"):
+                        # Remove data URI prefix (single scan, no split copy)
+                        comma = val.find(",")
+                        if comma != -1:
+                            val = val[comma + 1:]
+                    mapped[key] = caster(val) if val not in (None, "") else val
+                except Exception:
+                    mapped[key] = raw_val
             result = mapped
 
-        return JSONResponse(content=result)
+        return FastJSONResponse(content=result)
 
     except HTTPException as he:
         raise he
@@ -1023,23 +1332,17 @@ def run_agent_safely_unified(llm_input: str, pickle_path: str = None) -> Dict:
         questions = parsed["questions"]
 
         if pickle_path is None:
-            urls = re.findall(r"scrape_url_to_dataframe\(\s*['\"](.*?)['\"]\s*\)", code)
-            if urls:
-                url = urls[0]
-                tool_resp = scrape_url_to_dataframe(url)
-                if tool_resp.get("status") != "success":
-                    return {"error": f"Scrape tool failed: {tool_resp.get('message')}"}
-                df = pd.DataFrame(tool_resp["data"])
-                temp_pkl = tempfile.NamedTemporaryFile(suffix=".pkl", delete=False)
-                temp_pkl.close()
-                df.to_pickle(temp_pkl.name)
-                pickle_path = temp_pkl.name
+            pickle_path, scrape_error = prefetch_scrape_for_code(code)
+            if scrape_error:
+                return {"error": scrape_error}
 
         exec_result = write_and_run_temp_python(code, injected_pickle=pickle_path, timeout=LLM_TIMEOUT_SECONDS)
         if exec_result.get("status") != "success":
             return {"error": f"Execution failed: {exec_result.get('message')}", "raw": exec_result.get("raw")}
 
         results_dict = exec_result.get("result", {})
+        answered = sum(1 for q in questions if q in results_dict)
+        logger.info(f"Agent run ok: {answered}/{len(questions)} questions answered, {len(code)} chars of code")
         return {q: results_dict.get(q, "Answer not found") for q in questions}
         # return results_dict
 
@@ -1104,7 +1407,6 @@ from functools import partial
 from datetime import datetime, timedelta
 import socket
 import platform
-import psutil
 import shutil
 import tempfile
 import os
@@ -1160,6 +1462,7 @@ def _env_check(required=None):
     return out
 
 def _system_info():
+    import psutil
     info = {
         "host": socket.gethostname(),
         "platform": platform.system(),
@@ -1232,13 +1535,13 @@ def _installed_packages_sample():
     except Exception as e:
         return {"error": str(e)}
 
-def _network_probe_sync(url, timeout=30):
-    # synchronous network probe for threadpool use
+async def _network_probe(client, url):
+    # async network probe; runs on the event loop, no threadpool worker needed
     try:
-        r = requests.head(url, timeout=timeout)
+        r = await client.head(url)
         return {"ok": True, "status_code": r.status_code, "latency_ms": int(r.elapsed.total_seconds()*1000)}
     except Exception as e:
-        return {"ok": False, "error": str(e)}
+        return {"ok": False, "error": str(e) or type(e).__name__}
 
 # ---- LLM key+model light test (sync) ----
 # tries each key for each model with a short per-call timeout (run in threadpool)
@@ -1298,11 +1601,36 @@ def _test_gemini_key_model(key, model, ping_text="ping"):
         return {"ok": False, "error": str(e_outer)}
 
 # ---- Async wrappers that call the sync checks in threadpool ----
+# Shared async client for probes: keeps connections alive between /summary calls and
+# speaks HTTP/2 (multiplexed streams over one TLS session) when the h2 package is installed
+_DIAG_CLIENT = None
+
+def _get_diag_client():
+    global _DIAG_CLIENT
+    if _DIAG_CLIENT is None:
+        _DIAG_CLIENT = httpx.AsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            timeout=httpx.Timeout(30, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+            headers={"User-Agent": _HTTP.headers["User-Agent"]}
+        )
+    return _DIAG_CLIENT
+
+async def _close_diag_client():
+    global _DIAG_CLIENT
+    if _DIAG_CLIENT is not None:
+        await _DIAG_CLIENT.aclose()
+        # forget it so a restarted lifespan in this process builds a fresh client
+        _DIAG_CLIENT = None
+
 async def check_network():
-    coros = []
-    for name, url in DIAG_NETWORK_TARGETS.items():
-        coros.append(run_in_thread(_network_probe_sync, url, timeout=30))
-    results = await asyncio.gather(*[asyncio.create_task(c) for c in coros], return_exceptions=True)
+    # probes are pure I/O: fan them out with gather on one async client instead of
+    # occupying DIAG_PARALLELISM threadpool workers that the LLM key checks also need
+    client = _get_diag_client()
+    results = await asyncio.gather(
+        *[_network_probe(client, url) for url in DIAG_NETWORK_TARGETS.values()],
+        return_exceptions=True
+    )
     out = {}
     for (name, _), res in zip(DIAG_NETWORK_TARGETS.items(), results):
         if isinstance(res, Exception):
@@ -1341,11 +1669,22 @@ async def check_llm_keys_models():
     return {"models_tested": results}
 
 # ---- Optional slow heavy checks (DuckDB, Playwright) ----
+# one in-memory DuckDB connection for the process; callers take cheap cursors off it
+_DUCK = None
+_DUCK_LOCK = threading.Lock()
+
+def _duckdb_cursor():
+    global _DUCK
+    with _DUCK_LOCK:
+        if _DUCK is None:
+            import duckdb
+            _DUCK = duckdb.connect(database=":memory:")
+    return _DUCK.cursor()
+
 async def check_duckdb():
     try:
-        import duckdb
         def duck_check():
-            conn = duckdb.connect(":memory:")
+            conn = _duckdb_cursor()
             conn.execute("SELECT 1")
             conn.close()
             return {"duckdb": True}
@@ -1380,14 +1719,15 @@ async def diagnose(full: bool = Query(False, description="If true, run extended
         "elapsed_seconds": None
     }
 
-    # prepare tasks
+    # prepare tasks (all scheduled up front so they actually run concurrently;
+    # a bare coroutine would only start when awaited in the loop below)
     tasks = {
-        "env": run_in_thread(_env_check, ["gemini_api_1","gemini_api_2","gemini_api_3","gemini_api_4","gemini_api_5","gemini_api_6","gemini_api_7","gemini_api_8","gemini_api_9","gemini_api_10","GOOGLE_MODEL", "LLM_TIMEOUT_SECONDS"], timeout=30),
-        "system": run_in_thread(_system_info, timeout=30),
-        "tmp_write": run_in_thread(_temp_write_test, timeout=30),
-        "cwd_write": run_in_thread(_app_write_test, timeout=30),
-        "pandas": run_in_thread(_pandas_pipeline_test, timeout=30),
-        "packages": run_in_thread(_installed_packages_sample, timeout=50),
+        "env": asyncio.create_task(run_in_thread(_env_check, ["gemini_api_1","gemini_api_2","gemini_api_3","gemini_api_4","gemini_api_5","gemini_api_6","gemini_api_7","gemini_api_8","gemini_api_9","gemini_api_10","GOOGLE_MODEL", "LLM_TIMEOUT_SECONDS"], timeout=30)),
+        "system": asyncio.create_task(run_in_thread(_system_info, timeout=30)),
+        "tmp_write": asyncio.create_task(run_in_thread(_temp_write_test, timeout=30)),
+        "cwd_write": asyncio.create_task(run_in_thread(_app_write_test, timeout=30)),
+        "pandas": asyncio.create_task(run_in_thread(_pandas_pipeline_test, timeout=30)),
+        "packages": asyncio.create_task(run_in_thread(_installed_packages_sample, timeout=50)),
         "network": asyncio.create_task(check_network()),
         "llm_keys_models": asyncio.create_task(check_llm_keys_models())
     }